@@ -1,10 +1,11 @@
 import logging
+from typing import Callable
 
 from mailtrace.aggregator.base import LogAggregator
 from mailtrace.aggregator.opensearch import OpenSearch
 from mailtrace.aggregator.ssh_host import SSHHost
 from mailtrace.config import Config, Method
-from mailtrace.models import LogQuery
+from mailtrace.models import LogEntry, LogQuery
 from mailtrace.parser import (
     parse_exim_relay_info,
     parse_postfix_relay_info,
@@ -13,12 +14,12 @@ from mailtrace.utils import RelayResult, print_blue
 
 logger = logging.getLogger("mailtrace")
 
-# Services that perform mail relay (string constants)
-_RELAY_SERVICES = {
-    "postfix/smtp",
-    "postfix/lmtp",
-    "exim",
-    "exim4",
+# Services that perform mail relay, mapped to the parser for their logs
+_RELAY_PARSERS: dict[str, Callable[[LogEntry], RelayResult | None]] = {
+    "postfix/smtp": parse_postfix_relay_info,
+    "postfix/lmtp": parse_postfix_relay_info,
+    "exim": parse_exim_relay_info,
+    "exim4": parse_exim_relay_info,
 }
 
 
@@ -53,23 +54,19 @@ def do_trace(mail_id: str, aggregator: LogAggregator) -> RelayResult | None:
     logger.info("Tracing mail ID: %s", mail_id)
     log_entries = aggregator.query_by(LogQuery(mail_id=mail_id))
 
-    # Print all log entries
+    # Print all log entries, with a single write rather than one per entry
     print_blue("=== Log Entries ===")
-    for log_entry in log_entries:
-        print(log_entry)
+    if log_entries:
+        print("\n".join(map(str, log_entries)))
     print_blue("===================")
 
     # Analyze log entries to find relay information
     for log_entry in log_entries:
-        if log_entry.service not in _RELAY_SERVICES:
+        relay_parser = _RELAY_PARSERS.get(log_entry.service)
+        if relay_parser is None:
             continue
 
-        # Try Postfix relay parsing first
-        if log_entry.service in ("exim", "exim4"):
-            result = parse_exim_relay_info(log_entry)
-        else:
-            result = parse_postfix_relay_info(log_entry)
-
+        result = relay_parser(log_entry)
         if result:
             logger.info(
                 "Found relay %s [%s]:%d, new ID %s",
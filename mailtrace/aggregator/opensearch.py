@@ -1,15 +1,19 @@
 import logging
-from datetime import datetime
 
 import urllib3
-from opensearchpy import OpenSearch as OpenSearchClient
 from opensearchpy.helpers.search import Search
 
 from mailtrace.aggregator.base import LogAggregator
 from mailtrace.config import Config, OpenSearchConfig
 from mailtrace.models import LogEntry, LogQuery
+from mailtrace.opensearch_client import get_opensearch_client
 from mailtrace.parser import OpensearchParser
-from mailtrace.utils import get_hosts, time_range_to_timedelta
+from mailtrace.utils import (
+    format_iso_seconds,
+    get_hosts,
+    parse_iso_datetime,
+    time_range_to_timedelta,
+)
 
 logger = logging.getLogger("mailtrace")
 
@@ -42,13 +46,7 @@ class OpenSearch(LogAggregator):
         self.hosts = get_hosts(
             config.cluster_to_hosts(host) or [host], config.domain
         )
-        self.client = OpenSearchClient(
-            hosts=[{"host": self.config.host, "port": self.config.port}],
-            http_auth=(self.config.username, self.config.password),
-            use_ssl=self.config.use_ssl,
-            verify_certs=self.config.verify_certs,
-            timeout=self.config.timeout,
-        )
+        self.client = get_opensearch_client(self.config)
 
     def query_by(self, query: LogQuery) -> list[LogEntry]:
         """
@@ -78,10 +76,10 @@ class OpenSearch(LogAggregator):
         )
 
         if query.time and query.time_range:
-            time = datetime.fromisoformat(query.time.replace("Z", "+00:00"))
+            time = parse_iso_datetime(query.time)
             time_range = time_range_to_timedelta(query.time_range)
-            start_time = (time - time_range).strftime("%Y-%m-%dT%H:%M:%S")
-            end_time = (time + time_range).strftime("%Y-%m-%dT%H:%M:%S")
+            start_time = format_iso_seconds(time - time_range)
+            end_time = format_iso_seconds(time + time_range)
             search = search.filter(
                 "range",
                 **{
@@ -115,18 +113,22 @@ class OpenSearch(LogAggregator):
                     },
                 )
 
-        logger.debug(f"Query: {search.to_dict()}")
-        response = search.execute()
-        logger.debug(
-            f"Opensearch Response:\n{[hit.to_dict() for hit in response]}"
-        )
+        body = search.to_dict()
+        logger.debug("Query: %s", body)
+        # Use the raw response rather than search.execute(), which wraps
+        # every hit in Hit/AttrDict objects only to convert them back
+        response = self.client.search(index=self.config.index, body=body)
+        sources = [hit["_source"] for hit in response["hits"]["hits"]]
+        logger.debug("Opensearch Response:\n%s", sources)
 
         parser = OpensearchParser(mapping=self.config.mapping)
         parsed_log_entries = [
-            parser.parse_with_enrichment(hit.to_dict()) for hit in response
+            parser.parse_with_enrichment(source) for source in sources
         ]
         logger.debug(
-            f"Found {len(parsed_log_entries)} log entries.\n{parsed_log_entries}"
+            "Found %d log entries.\n%s",
+            len(parsed_log_entries),
+            parsed_log_entries,
         )
 
         return parsed_log_entries
@@ -1,7 +1,10 @@
 import datetime
 import logging
+import shlex
+from typing import Iterator
 
 import paramiko
+from paramiko.channel import ChannelStderrFile
 
 from mailtrace.aggregator.base import LogAggregator
 from mailtrace.config import Config
@@ -38,6 +41,10 @@ class SSHHost(LogAggregator):
         self.hosts = config.cluster_to_hosts(host) or [host]
         logger.info(f"SSHHost resolved '{host}' to hosts: {self.hosts}")
 
+        # Results of commands run with cache=True, keyed by
+        # (host, command, sudo)
+        self._command_cache: dict[tuple[str, str, bool], tuple[str, str]] = {}
+
         # Create SSH clients for each host
         self._clients: dict[str, paramiko.SSHClient] = {}
         for resolved_host in self.hosts:
@@ -107,11 +114,11 @@ class SSHHost(LogAggregator):
         client.connect(**connect_params)
         return client
 
-    def _execute_command(
+    def _start_command(
         self, host: str, command: str, sudo: bool = False
-    ) -> tuple[str, str]:
+    ) -> tuple[paramiko.ChannelFile, ChannelStderrFile]:
         """
-        Execute a command on the remote host via SSH.
+        Start a command on the remote host via SSH without waiting for it.
 
         Args:
             host: The hostname to execute the command on
@@ -119,83 +126,362 @@ class SSHHost(LogAggregator):
             sudo: Whether to run the command with sudo privileges
 
         Returns:
-            A tuple containing (stdout_content, stderr_content)
+            A tuple containing the (stdout, stderr) channel files
         """
 
         run_with_sudo = sudo or self.ssh_config.sudo
         if run_with_sudo:
             command = f"sudo -S -p '' {command}"
-        logger.debug(f"Executing command on {host}: {command}")
+        logger.debug("Executing command on %s: %s", host, command)
         client = self._clients[host]
         stdin, stdout, stderr = client.exec_command(command)
         if run_with_sudo:
             stdin.write(self.ssh_config.sudo_pass + "\n")
             stdin.flush()
+        return stdout, stderr
+
+    def _execute_command(
+        self, host: str, command: str, sudo: bool = False, cache: bool = False
+    ) -> tuple[str, str]:
+        """
+        Execute a command on the remote host via SSH.
+
+        Args:
+            host: The hostname to execute the command on
+            command: The command to execute
+            sudo: Whether to run the command with sudo privileges
+            cache: Whether to reuse the result of an earlier identical
+                command on this host. Only meant for commands whose output
+                does not change during a session, never for log reads.
+
+        Returns:
+            A tuple containing (stdout_content, stderr_content)
+        """
+
+        key = (host, command, sudo)
+        if cache and key in self._command_cache:
+            return self._command_cache[key]
+        stdout, stderr = self._start_command(host, command, sudo)
         stdout_content = stdout.read().decode()
         stderr_content = stderr.read().decode().strip()
+        if cache:
+            self._command_cache[key] = (stdout_content, stderr_content)
         return stdout_content, stderr_content
 
-    def _check_file_exists(self, host: str, file_path: str) -> bool:
+    def _iter_command_lines(
+        self, host: str, command: str, sudo: bool = False
+    ) -> Iterator[str]:
+        """
+        Execute a command on the remote host and yield its output lines.
+
+        Lines are read off the channel as they arrive, so the output is
+        never held in memory as a whole.
+
+        Args:
+            host: The hostname to execute the command on
+            command: The command to execute
+            sudo: Whether to run the command with sudo privileges
+
+        Yields:
+            Each non-empty stdout line, without its line ending
+
+        Raises:
+            ValueError: If the command wrote anything to stderr
         """
-        Check if a file exists on the remote host.
+
+        stdout, stderr = self._start_command(host, command, sudo)
+        for line in stdout:
+            line = line.rstrip("\r\n")
+            if line:
+                yield line
+        stderr_content = stderr.read().decode().strip()
+        if stderr_content:
+            raise ValueError(
+                f"Error executing command on {host}: {stderr_content}"
+            )
+
+    def _filter_existing_files(
+        self, host: str, log_files: list[str]
+    ) -> list[str]:
+        """
+        Keep the log files that exist on the remote host.
+
+        All files are tested with one batched command rather than one round
+        trip per file.  The result is cached for the session.
 
         Args:
             host: The hostname to check
-            file_path: Path to the file to check
+            log_files: Paths of the files to check
 
         Returns:
-            True if the file exists, False otherwise
+            The paths that exist, in their original order
         """
 
-        command = f"stat {file_path}"
-        stdout_content, _ = self._execute_command(host, command)
-        return stdout_content != ""
+        if not log_files:
+            return []
+        script = 'for f; do [ -e "$f" ] && printf "%s\\n" "$f"; done; true'
+        command = " ".join(
+            ["sh", "-c", shlex.quote(script), "sh"]
+            + [shlex.quote(log_file) for log_file in log_files]
+        )
+        stdout_content, _ = self._execute_command(host, command, cache=True)
+        existing = set(stdout_content.splitlines())
+        return [log_file for log_file in log_files if log_file in existing]
 
-    def _compose_read_command(self, host: str, query: LogQuery) -> str:
+    @staticmethod
+    def _compute_time_bounds(
+        query: LogQuery,
+    ) -> tuple[datetime.datetime, datetime.datetime] | None:
         """
-        Compose the appropriate command to read log files based on query parameters.
+        Compute the start and end of the queried time window.
 
         Args:
-            host: The hostname to query
             query: LogQuery object containing time and time_range parameters
 
+        Returns:
+            A (start, end) tuple, or None if the query has no time window
+        """
+
+        if not (query.time and query.time_range):
+            return None
+        timestamp = datetime.datetime.strptime(query.time, "%Y-%m-%d %H:%M:%S")
+        time_range = time_range_to_timedelta(query.time_range)
+        return timestamp - time_range, timestamp + time_range
+
+    @staticmethod
+    def _compose_time_window(
+        time_format: str,
+        bounds: tuple[datetime.datetime, datetime.datetime],
+    ) -> tuple[str, str]:
+        """
+        Format a time window with a host's log time format.
+
+        The formatted bounds compare as strings against the start of each
+        log line.
+
+        Args:
+            time_format: The host's log time format
+            bounds: (start, end) tuple from _compute_time_bounds
+
+        Returns:
+            A (start, end) tuple of formatted timestamps
+        """
+
+        start_time, end_time = bounds
+        return (
+            start_time.strftime(time_format),
+            end_time.strftime(time_format),
+        )
+
+    @staticmethod
+    def _parse_log_time(
+        line: str, time_format: str, width: int
+    ) -> datetime.datetime | None:
+        """
+        Parse the timestamp at the start of a log line.
+
+        Args:
+            line: The log line
+            time_format: The host's log time format
+            width: Length of a timestamp formatted with time_format
+
+        Returns:
+            The parsed timestamp, or None if the line does not start with
+            one in this format
+        """
+
+        try:
+            return datetime.datetime.strptime(line[:width], time_format)
+        except ValueError:
+            return None
+
+    def _select_files_in_window(
+        self,
+        host: str,
+        log_files: list[str],
+        time_format: str,
+        start: str,
+        end: str,
+    ) -> list[str]:
+        """
+        Drop log files whose contents lie entirely outside a time window.
+
+        The first and last line of every file are fetched with one batched
+        command, so rotated logs that cannot match are never scanned.  The
+        timestamps are parsed with the host's time format rather than
+        compared as text, since formats such as ``%b %d %H:%M:%S`` do not
+        sort as strings.  A file is kept whenever it cannot be classified:
+        unreadable or compressed files, lines that do not parse, and
+        year-less formats whose file or window wraps around a year end.
+
+        Args:
+            host: The hostname to query
+            log_files: Paths of the log files to consider
+            time_format: The host's log time format
+            start: Start of the window, in the host's log time format
+            end: End of the window, in the host's log time format
+
+        Returns:
+            The files that may contain lines inside the window
+        """
+
+        if not log_files:
+            return []
+        # Only printable ASCII is passed back, so binary (e.g. rotated .gz)
+        # files cannot break the output framing or its decoding
+        script = (
+            "edge() { head -c 256 | LC_ALL=C tr -cd '[:print:]'; }; "
+            'for f; do printf "%s\\n%s\\n%s\\n" "$f" '
+            '"$(head -n 1 "$f" | edge)" "$(tail -n 1 "$f" | edge)"; done'
+        )
+        command = " ".join(
+            ["sh", "-c", shlex.quote(script), "sh"]
+            + [shlex.quote(log_file) for log_file in log_files]
+        )
+        stdout, stderr = self._execute_command(host, command)
+        if stderr:
+            logger.warning("Probing log files on %s: %s", host, stderr)
+
+        width = len(start)
+        start_time = self._parse_log_time(start, time_format, width)
+        end_time = self._parse_log_time(end, time_format, width)
+        if start_time is None or end_time is None or start_time > end_time:
+            return log_files
+
+        lines = stdout.split("\n")
+        outside: set[str] = set()
+        for i in range(0, len(lines) - 2, 3):
+            log_file, first_line, last_line = lines[i : i + 3]
+            first_time = self._parse_log_time(first_line, time_format, width)
+            last_time = self._parse_log_time(last_line, time_format, width)
+            if first_time is None or last_time is None:
+                continue
+            if first_time > last_time:
+                # Year-less timestamps wrapped around; order is unknown
+                continue
+            if first_time > end_time or last_time < start_time:
+                logger.debug(
+                    "Skipping %s on %s: outside window", log_file, host
+                )
+                outside.add(log_file)
+        return [log_file for log_file in log_files if log_file not in outside]
+
+    def _compose_read_command(
+        self, query: LogQuery, time_window: tuple[str, str] | None
+    ) -> str:
+        """
+        Compose the appropriate command to read log files based on query parameters.
+
+        The time range and keyword filters are combined into a single awk
+        program, so each log file is scanned once by one process.
+
+        Args:
+            query: LogQuery object containing keywords and mail_id
+            time_window: (start, end) tuple from _compose_time_window, or
+                None to read regardless of time
+
         Returns:
             Command string
         """
 
-        host_config = self.ssh_config.get_host_config(host)
+        conditions: list[str] = []
 
-        if query.time and query.time_range:
+        if time_window:
             # get logs by time
-            timestamp = datetime.datetime.strptime(
-                query.time, "%Y-%m-%d %H:%M:%S"
+            start_time_str, end_time_str = time_window
+            conditions.append(
+                f'$0 >= "{start_time_str}" && $0 <= "{end_time_str}"'
             )
-            time_range = time_range_to_timedelta(query.time_range)
-            start_time = timestamp - time_range
-            end_time = timestamp + time_range
-            start_time_str = start_time.strftime(host_config.time_format)
-            end_time_str = end_time.strftime(host_config.time_format)
-            awk_command = f'{{if ($0 >= "{start_time_str}" && $0 <= "{end_time_str}") {{ print $0 }} }}'
-            command = f"awk '{awk_command}'"
-        else:
-            command = "cat"
-        return command
+
+        conditions.extend(self._compose_keyword_conditions(query.keywords))
+
+        options = ""
+        if query.mail_id:
+            # Drop lines that cannot mention the mail ID on the remote side,
+            # so they are never sent over SSH and parsed.  The ID is passed
+            # as an awk variable and matched as a fixed string.
+            options = f" -v {shlex.quote(f'mail_id={query.mail_id}')}"
+            conditions.append("index($0, mail_id)")
+
+        if not conditions:
+            return "cat"
+        # A pattern without an action prints every matching line
+        return f"awk{options} {shlex.quote(' && '.join(conditions))}"
 
     @staticmethod
-    def _compose_keyword_command(keywords: list[str]) -> str:
+    def _fold_case(pattern: str) -> str:
+        """
+        Make the literal letters of an extended regex match either case.
+
+        Each ASCII letter outside escapes and bracket expressions becomes a
+        ``[xX]`` class, so the pattern matches case-insensitively in any
+        awk without lowercasing it: escapes such as ``\\S`` and classes
+        such as ``[[:upper:]]`` keep their meaning.  Bracket expressions
+        are copied verbatim and therefore stay case-sensitive, as in
+        ``[A-Z]``.  "/" is escaped because it delimits the awk regex literal.
+
+        Args:
+            pattern: The extended regex to fold
+
+        Returns:
+            The case-folded regex, ready to put between slashes
         """
-        Compose grep commands to filter logs by keywords.
+
+        folded: list[str] = []
+        i, length = 0, len(pattern)
+        while i < length:
+            char = pattern[i]
+            if char == "\\" and i + 1 < length:
+                folded.append(pattern[i : i + 2])
+                i += 2
+                continue
+            if char == "[":
+                # Find the closing "]", which may come first in the list
+                # (after an optional "^") and does not close [:...:] etc.
+                j = i + 1
+                if j < length and pattern[j] == "^":
+                    j += 1
+                if j < length and pattern[j] == "]":
+                    j += 1
+                while j < length and pattern[j] != "]":
+                    if (
+                        pattern[j] == "["
+                        and j + 1 < length
+                        and pattern[j + 1] in ":.="
+                    ):
+                        close = pattern.find(pattern[j + 1] + "]", j + 2)
+                        j = length if close == -1 else close + 2
+                    else:
+                        j += 1
+                folded.append(pattern[i : j + 1].replace("/", r"\/"))
+                i = j + 1
+                continue
+            if char.isascii() and char.isalpha():
+                folded.append(f"[{char.lower()}{char.upper()}]")
+            elif char == "/":
+                folded.append(r"\/")
+            else:
+                folded.append(char)
+            i += 1
+        return "".join(folded)
+
+    @classmethod
+    def _compose_keyword_conditions(cls, keywords: list[str]) -> list[str]:
+        """
+        Compose awk conditions to filter logs by keywords.
+
+        Each keyword is matched as a case-insensitive extended regex, like
+        ``grep -iE`` did, by folding the case of its literal letters (see
+        :meth:`_fold_case`).
 
         Args:
             keywords: List of keywords to search for
 
         Returns:
-            String containing chained grep commands or empty string if no keywords
+            List of awk condition expressions, one per keyword
         """
 
-        if not keywords:
-            return ""
-        return "".join(f"| grep -iE {keyword}" for keyword in keywords)
+        return [f"$0 ~ /{cls._fold_case(keyword)}/" for keyword in keywords]
 
     def query_by(self, query: LogQuery) -> list[LogEntry]:
         """
@@ -215,40 +501,42 @@ class SSHHost(LogAggregator):
 
         all_parsed_logs: list[LogEntry] = []
 
+        # The window only depends on the query; each host just formats it
+        bounds = self._compute_time_bounds(query)
+
         for host in self.hosts:
-            logs: str = ""
             host_config = self.ssh_config.get_host_config(host)
-            command = self._compose_read_command(host, query)
+            time_window = (
+                self._compose_time_window(host_config.time_format, bounds)
+                if bounds
+                else None
+            )
+            command = self._compose_read_command(query, time_window)
 
-            for log_file in host_config.log_files:
-                if not self._check_file_exists(host, log_file):
-                    continue
-                complete_command = " ".join(
-                    [
-                        command,
-                        log_file,
-                        self._compose_keyword_command(query.keywords),
-                    ]
+            log_files = self._filter_existing_files(
+                host, host_config.log_files
+            )
+            if time_window:
+                log_files = self._select_files_in_window(
+                    host, log_files, host_config.time_format, *time_window
                 )
-                stdout, stderr = self._execute_command(host, complete_command)
-                if stderr:
-                    raise ValueError(
-                        f"Error executing command on {host}: {stderr}"
-                    )
-                logs += stdout
+            if not log_files:
+                continue
 
+            # Read every file with one command: one SSH round trip per host
+            # instead of one per file
+            complete_command = " ".join(
+                [command] + [shlex.quote(log_file) for log_file in log_files]
+            )
+
+            # Parse lines as they stream in and apply the mail ID filter in
+            # the same pass.  The remote filter is a substring match, so
+            # only entries whose parsed mail ID is an exact match are kept.
             parser = PARSERS[host_config.log_parser]()
-            parsed_logs = [
-                parser.parse_with_enrichment(line)
-                for line in logs.splitlines()
-                if line
-            ]
-
-            if query.mail_id:
-                parsed_logs = [
-                    log for log in parsed_logs if log.mail_id == query.mail_id
-                ]
-
-            all_parsed_logs.extend(parsed_logs)
+            for line in self._iter_command_lines(host, complete_command):
+                log = parser.parse_with_enrichment(line)
+                if query.mail_id and log.mail_id != query.mail_id:
+                    continue
+                all_parsed_logs.append(log)
 
         return all_parsed_logs
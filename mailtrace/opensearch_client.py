@@ -0,0 +1,52 @@
+"""Shared, cached OpenSearch client factory."""
+
+from functools import lru_cache
+
+from opensearchpy import OpenSearch as OpenSearchClient
+
+from mailtrace.config import OpenSearchConfig
+
+
+@lru_cache(maxsize=4)
+def _create_client(
+    host: str,
+    port: int,
+    username: str,
+    password: str,
+    use_ssl: bool,
+    verify_certs: bool,
+    timeout: int,
+) -> OpenSearchClient:
+    return OpenSearchClient(
+        hosts=[{"host": host, "port": port}],
+        http_auth=(username, password) if username else None,
+        use_ssl=use_ssl,
+        verify_certs=verify_certs,
+        timeout=timeout,
+        http_compress=True,
+    )
+
+
+def get_opensearch_client(config: OpenSearchConfig) -> OpenSearchClient:
+    """
+    Return an OpenSearch client for the given connection settings.
+
+    Clients are cached per connection settings, so every aggregator hop and
+    every tracing poll round reuses the same connection pool instead of
+    opening (and TLS-handshaking) new connections.
+
+    Args:
+        config (OpenSearchConfig): OpenSearch connection configuration.
+
+    Returns:
+        OpenSearchClient: A client connected to the configured cluster.
+    """
+    return _create_client(
+        config.host,
+        config.port,
+        config.username,
+        config.password,
+        config.use_ssl,
+        config.verify_certs,
+        config.timeout,
+    )
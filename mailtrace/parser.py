@@ -1,5 +1,6 @@
 import logging
 import re
+import sys
 from abc import ABC, abstractmethod
 from typing import Any
 
@@ -9,19 +10,31 @@ from mailtrace.utils import RelayResult, analyze_log_from_message
 
 logger = logging.getLogger("mailtrace")
 
-# Mail ID validation pattern (alphanumeric and hyphens, supports both Postfix and Exim formats)
-_MAIL_ID_RE = re.compile(r"^[0-9A-Za-z\-]+$")
-
 # Regex patterns for parsing Postfix log messages
-_SMTP_CODE_RE = re.compile(r"([0-9]{3})\s")
-_QUEUED_AS_RE = re.compile(r"(?:queued as|id=)(?P<id>[0-9A-Za-z\-]+)")
-_RELAY_RE = re.compile(
+_QUEUED_AS_RE = re.compile(r"(?:queued as |id=)(?P<id>[0-9A-Za-z\-]+)")
+# Relay target, next queue ID and SMTP code as one alternation, so a relay
+# line is scanned once; the relay alternative comes first so the digits of
+# its address and port are never taken for an SMTP code.
+_POSTFIX_RELAY_RE = re.compile(
     r"relay=(?P<host>[^\s]+)\[(?P<ip>[^\]]+)\]:(?P<port>[0-9]+)"
+    r"|(?:queued as |id=)(?P<id>[0-9A-Za-z\-]+)"
+    r"|(?P<code>[0-9]{3})\s"
 )
 
 # Regex patterns for parsing Exim log messages
+# (the local part excludes "@" so the address cannot be split several ways
+# when the rest of the line does not match)
 _EXIM_RELAY_RE = re.compile(
-    r"(?:=>|->)\s+\S+@\S+.*H=(?P<host>[^\s\[]+)\s+\[(?P<ip>[^\]]+)\].*C=\"[^\"]*queued as (?P<id>[0-9A-Za-z\-]+)"
+    r"(?:=>|->)\s+[^\s@]+@\S+.*H=(?P<host>[^\s\[]+)\s+\[(?P<ip>[^\]]+)\].*C=\"[^\"]*queued as (?P<id>[0-9A-Za-z\-]+)"
+)
+
+# Regex patterns for OpenSearch documents whose fields hold the raw message
+_OS_QUEUED_AS_RE = re.compile(r"queued as ([A-F0-9]+)")
+_OS_EXIM_STATUS_ID_RE = re.compile(
+    r"status=sent \([^)]*\bid=([A-Za-z0-9_-]+)\)"
+)
+_OS_EXIM_MAIL_ID_RE = re.compile(
+    r"\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}(?:\.\d+)?\s+([A-Za-z0-9_-]+)\s+(?:<=|=>|->|\*\*|Completed)"
 )
 
 
@@ -35,17 +48,31 @@ def _get_nested_value(data: Any, key: str) -> Any:
     return data
 
 
+def _intern(value: Any) -> Any:
+    """Intern *value* if it is a string, otherwise return it unchanged.
+
+    Hostnames and service names repeat across every log line of a query;
+    interning makes each distinct name a single shared object, so grouping
+    dicts and span attributes hash and compare it by identity.
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 def check_mail_id_valid(mail_id: str) -> bool:
     """
     Check if a mail ID is valid.
 
+    Valid IDs are ASCII alphanumerics and hyphens, which covers both Postfix
+    and Exim formats.  Checked with C-level string predicates rather than a
+    regex, as this runs for several candidates on every log line.
+
     Args:
         mail_id: The mail ID string to validate
 
     Returns:
         bool: True if the mail ID contains only alphanumeric characters (0-9, A-Z), False otherwise
     """
-    return bool(_MAIL_ID_RE.match(mail_id))
+    return mail_id.isascii() and mail_id.replace("-", "").isalnum()
 
 
 def extract_next_mail_id(log_entry: "LogEntry") -> str | None:
@@ -59,20 +86,46 @@ def extract_next_mail_id(log_entry: "LogEntry") -> str | None:
 
 def parse_postfix_relay_info(log_entry: "LogEntry") -> RelayResult | None:
     """Parse relay information from a successful SMTP log entry."""
-    smtp_match = _SMTP_CODE_RE.search(log_entry.message)
-    if not smtp_match:
-        return None
-
-    smtp_code = int(smtp_match.group(1))
-    if smtp_code != 250:
-        return None
+    # Entries from the aggregators are already enriched by
+    # analyze_log_from_message (or carry the fields from OpenSearch), so
+    # an accepted relay usually needs no further scanning.
+    if (
+        log_entry.smtp_code == 250
+        and log_entry.queued_as
+        and log_entry.relay_host
+        and log_entry.relay_port is not None
+    ):
+        return RelayResult(
+            mail_id=log_entry.queued_as,
+            relay_host=log_entry.relay_host,
+            relay_ip=log_entry.relay_ip,
+            relay_port=int(log_entry.relay_port),
+            smtp_code=250,
+        )
 
-    next_mail_id = extract_next_mail_id(log_entry)
-    if not next_mail_id:
+    # Lines without a relay target (most of them) cannot yield a result
+    if "relay=" not in log_entry.message:
         return None
 
-    relay_match = _RELAY_RE.search(log_entry.message)
-    if not relay_match:
+    smtp_code: int | None = None
+    next_mail_id = log_entry.queued_as
+    relay_match: re.Match[str] | None = None
+
+    # Walk the message once, keeping the first match of each field
+    for match in _POSTFIX_RELAY_RE.finditer(log_entry.message):
+        kind = match.lastgroup
+        if kind == "code":
+            if smtp_code is None:
+                smtp_code = int(match.group("code"))
+                if smtp_code != 250:
+                    return None
+        elif kind == "id":
+            if not next_mail_id:
+                next_mail_id = match.group("id")
+        elif relay_match is None:
+            relay_match = match
+
+    if smtp_code is None or not next_mail_id or relay_match is None:
         return None
 
     return RelayResult(
@@ -86,6 +139,11 @@ def parse_postfix_relay_info(log_entry: "LogEntry") -> RelayResult | None:
 
 def parse_exim_relay_info(log_entry: "LogEntry") -> RelayResult | None:
     """Parse relay information from an Exim delivery log entry."""
+    # Only deliveries accepted by the next hop carry a queued-as ID; the
+    # substring test skips every other line before the regex runs.
+    if "queued as " not in log_entry.message:
+        return None
+
     relay_match = _EXIM_RELAY_RE.search(log_entry.message)
     if not relay_match:
         return None
@@ -348,16 +406,14 @@ class OpensearchParser(LogParser):
         - Postfix → Exim: status=sent (250 OK id=1vs9hh-00005v-2k)
         """
         # Try Postfix format: queued as QUEUEID
-        queued_match = re.search(r"queued as ([A-F0-9]+)", message_content)
+        queued_match = _OS_QUEUED_AS_RE.search(message_content)
         if queued_match:
             queue_id = queued_match.group(1)
             if check_mail_id_valid(queue_id):
                 return queue_id
 
         # Try Exim format in status message: id=QUEUEID)
-        exim_match = re.search(
-            r"status=sent \([^)]*\bid=([A-Za-z0-9_-]+)\)", message_content
-        )
+        exim_match = _OS_EXIM_STATUS_ID_RE.search(message_content)
         if exim_match:
             queue_id = exim_match.group(1)
             if check_mail_id_valid(queue_id):
@@ -380,10 +436,7 @@ class OpensearchParser(LogParser):
 
         # Parse mail_id from message content
         # Try Exim format first: "YYYY-MM-DD HH:MM:SS.sss QUEUEID <=" or "YYYY-MM-DD HH:MM:SS QUEUEID <="
-        exim_match = re.search(
-            r"\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}(?:\.\d+)?\s+([A-Za-z0-9_-]+)\s+(?:<=|=>|->|\*\*|Completed)",
-            message_content,
-        )
+        exim_match = _OS_EXIM_MAIL_ID_RE.search(message_content)
         if exim_match:
             mail_id_candidate = exim_match.group(1)
             if check_mail_id_valid(mail_id_candidate):
@@ -430,8 +483,8 @@ class OpensearchParser(LogParser):
 
         return LogEntry(
             datetime=_get_nested_value(log, self.mapping.timestamp),
-            hostname=_get_nested_value(log, self.mapping.hostname),
-            service=_get_nested_value(log, self.mapping.service),
+            hostname=_intern(_get_nested_value(log, self.mapping.hostname)),
+            service=_intern(_get_nested_value(log, self.mapping.service)),
             mail_id=mail_id,
             message=message,
             # Structured fields (may be None, will be enriched from message)
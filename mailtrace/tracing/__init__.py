@@ -1,9 +1,10 @@
 import logging
 import re
 from datetime import datetime, timedelta
-from time import sleep, time
+from time import sleep
 from typing import Dict, Optional
 
+from opensearchpy.exceptions import OpenSearchException
 from opentelemetry import trace
 
 from mailtrace.config import Config
@@ -11,109 +12,37 @@ from mailtrace.parser import LogEntry
 from mailtrace.tracing.delay_parser import (
     DelayInfo,
     detect_mta_from_entries,
-    get_parser_for_mta,
+    parse_delay_info,
 )
 from mailtrace.tracing.otel import (
+    MIN_SPAN_DURATION_NS,
     create_delay_spans,
     create_host_span,
     create_root_span,
     dt_to_ns,
+    exporter_enabled,
     flush_traces,
     init_exporter,
 )
 from mailtrace.tracing.query import (
     group_logs_by_hosts,
     group_logs_by_message_id,
-    query_all_logs,
+    iter_all_logs,
 )
+from mailtrace.tracing.utils import TimingMetrics
+from mailtrace.utils import extract_address, parse_iso_datetime
 
 logger = logging.getLogger("mailtrace")
 
+# Number of polling rounds a query window may span after failed queries
+# before older logs are given up on
+_MAX_CATCH_UP_ROUNDS = 10
+
 _EXIM_DELIVERY_RECIPIENT_RE = re.compile(
     r"\s(?:=>|->|\*\*)\s+([^\s<>:]+@[^\s<>:]+)"
 )
 
 
-class TimingMetrics:
-    """Tracks timing information for trace generation."""
-
-    def __init__(self):
-        self.metrics: Dict[str, float] = {}
-        self.start_time: float = 0
-        self.trace_count: int = 0
-
-    def start(self) -> None:
-        """Start the overall timing."""
-        self.start_time = time()
-        self.metrics.clear()
-        self.trace_count = 0
-
-    def mark(self, step_name: str) -> None:
-        """Mark the end time of a step."""
-        if self.start_time == 0:
-            logger.warning("Timing not started, ignoring mark")
-            return
-        elapsed = time() - self.start_time
-        self.metrics[step_name] = elapsed
-
-    def set_trace_count(self, count: int) -> None:
-        """Set the number of traces generated."""
-        self.trace_count = count
-
-    def get_step_duration(
-        self, step_name: str, previous_step: str | None = None
-    ) -> float:
-        """Get the duration of a specific step.
-
-        Args:
-            step_name: Name of the current step
-            previous_step: Name of the previous step (if any)
-
-        Returns:
-            Duration in seconds
-        """
-        if step_name not in self.metrics:
-            return 0.0
-
-        current = self.metrics[step_name]
-        if previous_step and previous_step in self.metrics:
-            return current - self.metrics[previous_step]
-        return current
-
-    def print_summary(self) -> None:
-        """Print timing summary with total and per-step durations."""
-        if not self.metrics:
-            logger.info("No timing metrics recorded")
-            return
-
-        total_time = self.get_step_duration(list(self.metrics.keys())[-1])
-
-        logger.info("=" * 70)
-        logger.info("TRACE GENERATION TIMING SUMMARY")
-        logger.info("=" * 70)
-
-        steps = list(self.metrics.keys())
-        previous_step = None
-
-        for step in steps:
-            step_duration = self.get_step_duration(step, previous_step)
-            percentage = (
-                (step_duration / total_time * 100) if total_time > 0 else 0
-            )
-            logger.info(
-                f"  {step:<40} {step_duration:>8.4f}s ({percentage:>5.1f}%)"
-            )
-            previous_step = step
-
-        logger.info("-" * 70)
-        logger.info(f"  {'TOTAL':<40} {total_time:>8.4f}s (100.0%)")
-        if self.trace_count > 0:
-            avg_time = total_time / self.trace_count
-            logger.info(f"  {'Traces generated':<40} {self.trace_count:>8d}")
-            logger.info(f"  {'Avg time per trace':<40} {avg_time:>8.4f}s")
-        logger.info("=" * 70)
-
-
 class EmailTracesGenerator:
     def __init__(self, config: Config, otel_endpoint: str) -> None:
         self.config = config
@@ -161,7 +90,9 @@ class EmailTracesGenerator:
                 skipped = len(new_logs) - added
                 if skipped:
                     logger.debug(
-                        f"Deduped {skipped} duplicate log(s) for message_id {message_id}"
+                        "Deduped %d duplicate log(s) for message_id %s",
+                        skipped,
+                        message_id,
                     )
                 self._pending[message_id] = (
                     existing_logs + deduped,
@@ -207,17 +138,15 @@ class EmailTracesGenerator:
 
         for log in logs:
             if not sender:
-                from_match = re.search(r"from=<([^>]*)>", log.message)
-                if from_match:
-                    sender = from_match.group(1)
+                from_address = extract_address(log.message, "from")
+                if from_address is not None:
+                    sender = from_address
 
             # Extract all recipients from this log
-            to_match = re.search(r"to=<([^>]*)>", log.message)
-            if to_match:
-                recipient = to_match.group(1)
-                if recipient not in seen_recipients:
-                    recipients.append(recipient)
-                    seen_recipients.add(recipient)
+            recipient = extract_address(log.message, "to")
+            if recipient is not None and recipient not in seen_recipients:
+                recipients.append(recipient)
+                seen_recipients.add(recipient)
 
             exim_delivery_match = _EXIM_DELIVERY_RECIPIENT_RE.search(
                 log.message
@@ -237,61 +166,89 @@ class EmailTracesGenerator:
 
         Returns the number of traces successfully exported.
         """
+        if not exporter_enabled():
+            logger.debug("OTel exporter not initialised, skipping export")
+            return 0
+
         trace_count = 0
 
         for message_id, message_id_logs in logs_by_message_id.items():
             hosts_logs = group_logs_by_hosts(message_id_logs)
-            logger.debug(
-                f"Processing email with message_id {message_id} and hosts {list(hosts_logs.keys())}"
-            )
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Processing email with message_id %s and hosts %s",
+                    message_id,
+                    list(hosts_logs.keys()),
+                )
 
-            host_info: dict[str, tuple[DelayInfo, datetime, datetime]] = {}
+            # Host start/end are kept as epoch nanoseconds so each is
+            # converted once and reused by the root, host and stage spans.
+            host_info: dict[
+                str, tuple[DelayInfo, int, int, Optional[str], Optional[str]]
+            ] = {}
+            # Root span covers the full delivery window across all hosts;
+            # its extents are tracked while the hosts are swept.
+            root_start_ns: Optional[int] = None
+            root_end_ns: Optional[int] = None
 
             # For each host, detect the MTA, parse the logs to extract delay info,
-            # and determine the start and end times for the host span
+            # and determine the start and end times for the host span. The
+            # first queue ID and relay host are picked up in the same sweep.
             for host, host_logs in hosts_logs.items():
                 mta = detect_mta_from_entries(host_logs)
-                parser = get_parser_for_mta(mta)
                 delay_info = DelayInfo()
                 delay_end: datetime | None = None
+                queue_id: Optional[str] = None
+                next_host: Optional[str] = None
                 for log in host_logs:
-                    parsed_delay = parser.parse(log.message)
+                    if queue_id is None and log.mail_id:
+                        queue_id = log.mail_id
+                    if next_host is None and log.relay_host:
+                        next_host = log.relay_host
+                    parsed_delay = parse_delay_info(mta, log.message)
                     if delay_end is None and parsed_delay.get_delay_values():
-                        delay_end = datetime.fromisoformat(
-                            log.datetime.replace("Z", "+00:00")
-                        )
+                        delay_end = parse_iso_datetime(log.datetime)
                     delay_info |= parsed_delay
-                logger.debug(f"Host {host} has delay info: {delay_info}")
+                logger.debug("Host %s has delay info: %s", host, delay_info)
 
                 if delay_end is not None:
                     host_end = delay_end
                     host_start = host_end - timedelta(
                         seconds=delay_info.total_delay
                     )
+                    host_start_ns = dt_to_ns(host_start)
+                    host_end_ns = dt_to_ns(host_end)
                 else:
-                    host_start = min(
-                        datetime.fromisoformat(
-                            log.datetime.replace("Z", "+00:00")
-                        )
+                    # Hosts without delay info (typically the final local
+                    # delivery hop) still belong on the message's path, so
+                    # they get a minimal span at their first log line.
+                    logger.debug("Host %s has no delay info", host)
+                    host_start_ns = min(
+                        dt_to_ns(parse_iso_datetime(log.datetime))
                         for log in host_logs
                     )
-                    host_end = host_start + timedelta(
-                        seconds=delay_info.total_delay
-                    )
-                host_info[host] = (delay_info, host_start, host_end)
+                    host_end_ns = host_start_ns + MIN_SPAN_DURATION_NS
+                if root_start_ns is None or host_start_ns < root_start_ns:
+                    root_start_ns = host_start_ns
+                if root_end_ns is None or host_end_ns > root_end_ns:
+                    root_end_ns = host_end_ns
+                host_info[host] = (
+                    delay_info,
+                    host_start_ns,
+                    host_end_ns,
+                    queue_id,
+                    next_host,
+                )
 
-            if not host_info:
+            if root_start_ns is None or root_end_ns is None:
                 logger.debug(
-                    f"No delay info found for message_id {message_id}, skipping"
+                    "No delay info found for message_id %s, skipping",
+                    message_id,
                 )
                 continue
 
             trace_count += 1
 
-            # Root span covers the full delivery window across all hosts
-            root_start = min(info[1] for info in host_info.values())
-            root_end = max(info[2] for info in host_info.values())
-
             # Extract sender and recipients from logs
             sender, recipients = self._extract_sender_recipient(
                 message_id_logs
@@ -299,32 +256,25 @@ class EmailTracesGenerator:
 
             # Create root span with sender and recipients attributes
             root_span = create_root_span(
-                message_id, root_start, sender=sender, recipients=recipients
+                message_id, root_start_ns, sender=sender, recipients=recipients
             )
             root_ctx = trace.set_span_in_context(root_span)
 
             # Create host spans and their child delay spans
-            for host, (delays, host_start, host_end) in host_info.items():
+            for host, (
+                delays,
+                host_start_ns,
+                host_end_ns,
+                host_queue_id,
+                host_next_host,
+            ) in host_info.items():
                 # Extract sender and recipients specific to this host
                 host_sender, host_recipients = self._extract_sender_recipient(
                     hosts_logs[host]
                 )
-                # Extract the first queue ID for this host from the logs
-                host_queue_id = next(
-                    (log.mail_id for log in hosts_logs[host] if log.mail_id),
-                    None,
-                )
-                host_next_host = next(
-                    (
-                        log.relay_host
-                        for log in hosts_logs[host]
-                        if log.relay_host
-                    ),
-                    None,
-                )
                 host_span = create_host_span(
                     host,
-                    host_start,
+                    host_start_ns,
                     root_ctx,
                     message_id=message_id,
                     sender=host_sender,
@@ -334,16 +284,16 @@ class EmailTracesGenerator:
                 )
                 host_ctx = trace.set_span_in_context(host_span)
 
-                # Create delay stage spans (siblings under the host span)
-                create_delay_spans(delays, host, host_start, host_ctx)
+                # Create delay stage spans (siblings under the host span);
+                # hosts without delay info have none
+                if delays.get_delay_values():
+                    create_delay_spans(delays, host, host_start_ns, host_ctx)
 
-                logger.debug(
-                    f"Close host span: {host} at {host_end.isoformat()}"
-                )
-                host_span.end(end_time=dt_to_ns(host_end))
+                logger.debug("Close host span: %s at %d", host, host_end_ns)
+                host_span.end(end_time=host_end_ns)
 
             # End the root span last
-            root_span.end(end_time=int(root_end.timestamp() * 1e9))
+            root_span.end(end_time=root_end_ns)
 
         return trace_count
 
@@ -353,7 +303,6 @@ class EmailTracesGenerator:
         try:
             while True:
                 self.timing.start()
-                self._current_round += 1
 
                 # Query new logs for this iteration window.
                 # Start slightly before last_query_time so that logs whose
@@ -364,27 +313,58 @@ class EmailTracesGenerator:
                 go_back = timedelta(
                     seconds=self.config.tracing.go_back_seconds
                 )
+                # After failed rounds the window keeps growing; cap it so a
+                # long outage cannot turn into one unbounded query.
+                earliest = query_end - timedelta(
+                    seconds=sleep_seconds * _MAX_CATCH_UP_ROUNDS
+                )
+                if self.last_query_time < earliest:
+                    logger.warning(
+                        "Query window capped: logs between %s and %s are "
+                        "not traced",
+                        self.last_query_time,
+                        earliest,
+                    )
+                    self.last_query_time = earliest
                 query_start = self.last_query_time - go_back
-                logs = query_all_logs(self.config, query_start, query_end)
+                # Group the logs as they stream in, so only those tied to a
+                # message ID are kept in memory.  A query that fails partway
+                # would leave a truncated batch, so the whole round is
+                # skipped and the same window is queried again next time.
+                try:
+                    new_logs_by_message_id = group_logs_by_message_id(
+                        iter_all_logs(self.config, query_start, query_end)
+                    )
+                except (OpenSearchException, ConnectionError) as e:
+                    logger.error("Error querying logs from OpenSearch: %s", e)
+                    sleep(sleep_seconds)
+                    continue
                 self.timing.mark("query_logs")
+                self._current_round += 1
 
                 # Accumulate new logs into the per-message-ID buffer, refreshing
                 # the last-seen round for any ID that appeared in this batch
-                new_logs_by_message_id = group_logs_by_message_id(logs)
                 self._accumulate_logs(new_logs_by_message_id)
 
                 logger.debug(
-                    f"Round {self._current_round}: {len(new_logs_by_message_id)} message IDs in new batch, "
-                    f"{len(self._pending)} total buffered (hold_rounds={hold_rounds})"
+                    "Round %d: %d message IDs in new batch, "
+                    "%d total buffered (hold_rounds=%d)",
+                    self._current_round,
+                    len(new_logs_by_message_id),
+                    len(self._pending),
+                    hold_rounds,
                 )
 
                 # Only export traces for IDs that have been quiet for hold_rounds
                 ready_logs = self._collect_ready()
                 trace_count = 0
                 if ready_logs:
-                    logger.debug(
-                        f"Exporting {len(ready_logs)} ready message ID(s): {list(ready_logs.keys())}"
-                    )
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(
+                            "Exporting %d ready message ID(s): %s",
+                            len(ready_logs),
+                            list(ready_logs.keys()),
+                        )
                     trace_count = self._export_traces(ready_logs)
                 self.timing.mark("create_spans")
 
@@ -8,8 +8,16 @@ formats, so parsers can be added for each system.
 import re
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
 
+# Postfix delays breakdown: delays=A/B/C/D
+_POSTFIX_DELAYS_RE = re.compile(r"delays=([\d.]+)/([\d.]+)/([\d.]+)/([\d.]+)")
+# Exim QT (queue time), RT (receive time) and DT (delivery time): XT=X.XXs
+_EXIM_QT_RE = re.compile(r"QT=([\d.]+)s?")
+_EXIM_RT_RE = re.compile(r"RT=([\d.]+)s?")
+_EXIM_DT_RE = re.compile(r"DT=([\d.]+)s?")
+
 # Ordered delay stages for consistent stage ordering
 # Postfix delay stages
 POSTFIX_DELAY_STAGES = [
@@ -26,11 +34,17 @@ EXIM_DELAY_STAGES = [
     "deliver_time",
 ]
 
+# Every DelayInfo field, so merges can walk them in a single loop
+_DELAY_FIELDS = tuple(POSTFIX_DELAY_STAGES + EXIM_DELAY_STAGES)
+
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class DelayInfo:
     """Parsed delay information from a log message.
 
+    Instances are immutable so that cached results of
+    :func:`parse_delay_info` can be shared safely; combine them with ``|``.
+
     Attributes:
         before_qmgr: Delay before queue manager (Postfix)
         in_qmgr: Delay in queue manager (Postfix)
@@ -54,39 +68,14 @@ class DelayInfo:
     def __or__(self, value):
         if isinstance(value, DelayInfo):
             return DelayInfo(
-                before_qmgr=(
-                    self.before_qmgr
-                    if self.before_qmgr is not None
-                    else value.before_qmgr
-                ),
-                in_qmgr=(
-                    self.in_qmgr if self.in_qmgr is not None else value.in_qmgr
-                ),
-                conn_setup=(
-                    self.conn_setup
-                    if self.conn_setup is not None
-                    else value.conn_setup
-                ),
-                transmission=(
-                    self.transmission
-                    if self.transmission is not None
-                    else value.transmission
-                ),
-                queue_time=(
-                    self.queue_time
-                    if self.queue_time is not None
-                    else value.queue_time
-                ),
-                receive_time=(
-                    self.receive_time
-                    if self.receive_time is not None
-                    else value.receive_time
-                ),
-                deliver_time=(
-                    self.deliver_time
-                    if self.deliver_time is not None
-                    else value.deliver_time
-                ),
+                **{
+                    name: (
+                        mine
+                        if (mine := getattr(self, name)) is not None
+                        else getattr(value, name)
+                    )
+                    for name in _DELAY_FIELDS
+                }
             )
         return self
 
@@ -178,19 +167,20 @@ class PostfixDelayParser(DelayParser):
         Returns:
             DelayInfo object with parsed delay information
         """
-        delay_info = DelayInfo()
-
         # Parse delays breakdown: delays=A/B/C/D
-        breakdown_match = re.search(
-            r"delays=([\d.]+)/([\d.]+)/([\d.]+)/([\d.]+)", message
-        )
-        if breakdown_match:
-            delay_info.before_qmgr = float(breakdown_match.group(1))
-            delay_info.in_qmgr = float(breakdown_match.group(2))
-            delay_info.conn_setup = float(breakdown_match.group(3))
-            delay_info.transmission = float(breakdown_match.group(4))
+        breakdown_match = _POSTFIX_DELAYS_RE.search(message)
+        if not breakdown_match:
+            return DelayInfo()
 
-        return delay_info
+        before_qmgr, in_qmgr, conn_setup, transmission = map(
+            float, breakdown_match.groups()
+        )
+        return DelayInfo(
+            before_qmgr=before_qmgr,
+            in_qmgr=in_qmgr,
+            conn_setup=conn_setup,
+            transmission=transmission,
+        )
 
     def get_mta_type(self) -> str:
         """Get the MTA type for this parser."""
@@ -221,31 +211,29 @@ class EximDelayParser(DelayParser):
         Returns:
             DelayInfo object with parsed delay information
         """
-        delay_info = DelayInfo()
-
         # Parse QT (Queue Time): QT=X.XXs
-        qt_match = re.search(r"QT=([\d.]+)s?", message)
+        qt_match = _EXIM_QT_RE.search(message)
         qt = 0
         if qt_match:
             qt = float(qt_match.group(1))
 
         # Parse RT (Receive Time): RT=X.XXs
-        rt_match = re.search(r"RT=([\d.]+)s?", message)
-        if rt_match:
-            delay_info.receive_time = float(rt_match.group(1))
+        rt_match = _EXIM_RT_RE.search(message)
+        receive_time = float(rt_match.group(1)) if rt_match else None
 
         # Parse DT (Delivery Time): DT=X.XXs
-        dt_match = re.search(r"DT=([\d.]+)s?", message)
-        if dt_match:
-            delay_info.deliver_time = float(dt_match.group(1))
+        dt_match = _EXIM_DT_RE.search(message)
+        deliver_time = float(dt_match.group(1)) if dt_match else None
 
         # Calculate queue_time = QT - RT - DT
-        if delay_info.total_delay is not None:
-            rt = delay_info.receive_time or 0.0
-            dt = delay_info.deliver_time or 0.0
-            delay_info.queue_time = max(0.0, qt - rt - dt)
+        rt = receive_time or 0.0
+        dt = deliver_time or 0.0
 
-        return delay_info
+        return DelayInfo(
+            queue_time=max(0.0, qt - rt - dt),
+            receive_time=receive_time,
+            deliver_time=deliver_time,
+        )
 
     def get_mta_type(self) -> str:
         """Get the MTA type for this parser."""
@@ -287,3 +275,20 @@ def get_parser_for_mta(mta_type: Optional[str]) -> DelayParser:
         return EximDelayParser()
     else:
         return PostfixDelayParser()
+
+
+@lru_cache(maxsize=4096)
+def parse_delay_info(mta_type: Optional[str], message: str) -> DelayInfo:
+    """Parse delay information from a log message, memoised by message.
+
+    Log lines returned again by the overlapping ``go_back_seconds`` query
+    window are only parsed once.
+
+    Args:
+        mta_type: MTA type string ('postfix' or 'exim')
+        message: The log message to parse
+
+    Returns:
+        DelayInfo object with parsed delay information
+    """
+    return get_parser_for_mta(mta_type).parse(message)
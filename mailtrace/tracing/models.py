@@ -9,6 +9,7 @@ from datetime import datetime
 from typing import Optional
 
 from mailtrace.parser import LogEntry
+from mailtrace.utils import extract_address, parse_iso_datetime
 
 logger = logging.getLogger("mailtrace")
 
@@ -49,22 +50,18 @@ class EmailTrace:
             self.queue_ids.add(entry.mail_id)
 
         # Update time boundaries
-        entry_time = datetime.fromisoformat(
-            entry.datetime.replace("Z", "+00:00")
-        )
+        entry_time = parse_iso_datetime(entry.datetime)
         if self.start_time is None or entry_time < self.start_time:
             self.start_time = entry_time
         if self.end_time is None or entry_time > self.end_time:
             self.end_time = entry_time
 
-        # Extract sender/recipient from message using regex
-        import re
-
+        # Extract sender/recipient from message
         if not self.sender:
-            from_match = re.search(r"from=<([^>]*)>", entry.message)
-            if from_match:
-                self.sender = from_match.group(1)
+            sender = extract_address(entry.message, "from")
+            if sender is not None:
+                self.sender = sender
         if not self.recipient:
-            to_match = re.search(r"to=<([^>]*)>", entry.message)
-            if to_match:
-                self.recipient = to_match.group(1)
+            recipient = extract_address(entry.message, "to")
+            if recipient is not None:
+                self.recipient = recipient
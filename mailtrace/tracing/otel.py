@@ -1,9 +1,11 @@
 from __future__ import annotations
 
-import json
+import hashlib
 import logging
-from datetime import datetime, timedelta
-from typing import Any, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterator, Optional
 
 from opentelemetry import trace
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import (
@@ -12,65 +14,181 @@ from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import (
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.id_generator import RandomIdGenerator
 
 from mailtrace.tracing.delay_parser import DelayInfo
 
-_exporter: Optional[OTLPSpanExporter] = None
+_span_processor: Optional[BatchSpanProcessor] = None
 _providers: dict[str, TracerProvider] = {}
+_tracers: dict[str, trace.Tracer] = {}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Avoid zero-duration spans which may be ignored by the back-end.
+MIN_SPAN_DURATION_NS = 2_000
+
+# BatchSpanProcessor tuning. A larger queue absorbs the burst of spans
+# ended right before flush_traces(), while smaller batches keep each OTLP
+# gRPC export request well below the 4 MB default message size limit.
+MAX_QUEUE_SIZE = 4096
+MAX_EXPORT_BATCH_SIZE = 128
+SCHEDULE_DELAY_MILLIS = 1000
+EXPORT_TIMEOUT_MILLIS = 10000
+
+# gRPC keepalive for the exporter channel, so a connection that went away
+# while sleeping between polling rounds is noticed instead of stalling the
+# next export.  The ping interval matches the default minimum that gRPC
+# servers (including the OTel Collector) enforce, to avoid being sent a
+# GOAWAY for pinging too often.
+GRPC_CHANNEL_OPTIONS = (
+    ("grpc.keepalive_time_ms", 300000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.http2.max_pings_without_data", 0),
+)
 
 logger = logging.getLogger("mailtrace")
 
 
+def message_id_to_trace_id(message_id: str) -> int:
+    """Derive a stable 128-bit OTEL trace ID from a ``Message-ID``.
+
+    Unlike :func:`hash`, BLAKE2b is not salted per process, so the same
+    message always maps to the same trace across runs and restarts.
+    """
+    digest = hashlib.blake2b(
+        message_id.encode("utf-8"), digest_size=16
+    ).digest()
+    return int.from_bytes(digest, "big")
+
+
+class _MessageTraceIdGenerator(RandomIdGenerator):
+    """ID generator that derives the trace ID of root spans from a message.
+
+    While a message ID is set with :meth:`use_message_id`, new traces get
+    :func:`message_id_to_trace_id` as their trace ID; span IDs and traces
+    started without a message ID stay random.  The message ID is held in
+    a :class:`~contextvars.ContextVar`, so concurrent root spans started
+    from different threads or tasks cannot pick up each other's IDs.
+    """
+
+    def __init__(self) -> None:
+        self._message_id: ContextVar[Optional[str]] = ContextVar(
+            "mailtrace_trace_message_id", default=None
+        )
+
+    @contextmanager
+    def use_message_id(self, message_id: str) -> Iterator[None]:
+        """Derive trace IDs from *message_id* within the ``with`` block."""
+        token = self._message_id.set(message_id)
+        try:
+            yield
+        finally:
+            self._message_id.reset(token)
+
+    def generate_trace_id(self) -> int:
+        message_id = self._message_id.get()
+        if message_id is None:
+            return super().generate_trace_id()
+        return message_id_to_trace_id(message_id)
+
+
+_id_generator = _MessageTraceIdGenerator()
+
+
 def init_exporter(endpoint: str) -> None:
-    """Initialise the shared OTLP exporter.
+    """Initialise the shared OTLP exporter and span processor.
 
     Must be called once (e.g. at application startup) before any
     ``create_*`` function is used.  Clears all cached
     :class:`~opentelemetry.sdk.trace.TracerProvider` instances so a fresh
     exporter connection is used.
 
+    A single :class:`~opentelemetry.sdk.trace.export.BatchSpanProcessor`
+    (one queue, one worker thread, one gRPC channel) is shared by every
+    per-host provider; the providers only differ in their resource.
+
     Args:
         endpoint: OTLP gRPC endpoint, e.g. ``"http://localhost:4317"``.
     """
-    global _exporter
-    _exporter = OTLPSpanExporter(endpoint=endpoint, insecure=True)
+    global _span_processor
+    if _span_processor is not None:
+        _span_processor.shutdown()
+    _span_processor = BatchSpanProcessor(
+        OTLPSpanExporter(
+            endpoint=endpoint,
+            insecure=True,
+            # The exporter types option values as str, but gRPC takes
+            # integer-valued options such as keepalive as int
+            channel_options=GRPC_CHANNEL_OPTIONS,  # pyright: ignore[reportArgumentType]
+        ),
+        max_queue_size=MAX_QUEUE_SIZE,
+        schedule_delay_millis=SCHEDULE_DELAY_MILLIS,
+        max_export_batch_size=MAX_EXPORT_BATCH_SIZE,
+        export_timeout_millis=EXPORT_TIMEOUT_MILLIS,
+    )
     _providers.clear()
+    _tracers.clear()
 
 
 def flush_traces() -> None:
-    """Force-flush every cached provider.
+    """Force-flush the shared span processor.
 
     Blocks until all buffered spans have been delivered to the collector.
     Call this once after all spans for a polling cycle have been ended.
     """
-    for provider in _providers.values():
-        provider.force_flush()
+    if _span_processor is not None:
+        _span_processor.force_flush()
+
+
+def exporter_enabled() -> bool:
+    """Return whether :func:`init_exporter` has set up span export.
+
+    Without it spans are still built and attributed but then discarded,
+    so callers can skip the work entirely.
+    """
+    return _span_processor is not None
 
 
 def _get_tracer(service_name: str) -> trace.Tracer:
-    """Return (and lazily create) a tracer for *service_name*."""
-    if service_name not in _providers:
+    """Return (and lazily create) a tracer for *service_name*.
+
+    ``TracerProvider.get_tracer`` builds a new tracer and instrumentation
+    scope on every call, so the tracer is cached alongside its provider.
+    """
+    tracer = _tracers.get(service_name)
+    if tracer is None:
         resource = Resource(
             attributes={
                 "service.name": service_name,
                 "service.version": "1.0.0",
             }
         )
-        provider = TracerProvider(resource=resource)
-        if _exporter is not None:
-            provider.add_span_processor(BatchSpanProcessor(_exporter))
+        provider = TracerProvider(
+            resource=resource, id_generator=_id_generator
+        )
+        if _span_processor is not None:
+            provider.add_span_processor(_span_processor)
         _providers[service_name] = provider
-    return _providers[service_name].get_tracer(__name__)
+        tracer = _tracers[service_name] = provider.get_tracer(__name__)
+    return tracer
 
 
 def dt_to_ns(dt: datetime) -> int:
-    """Convert a :class:`~datetime.datetime` to an integer nanosecond timestamp."""
-    return int(dt.timestamp() * 1e9)
+    """Convert a :class:`~datetime.datetime` to an integer nanosecond timestamp.
+
+    Uses integer arithmetic only, so microsecond precision is kept exactly
+    instead of going through a float ``timestamp()``.  Naive datetimes are
+    taken as local time, as :meth:`~datetime.datetime.timestamp` does.
+    """
+    if dt.tzinfo is None:
+        dt = dt.astimezone()
+    return (dt - _EPOCH) // _MICROSECOND * 1000
 
 
 def create_root_span(
     message_id: str,
-    start_time: datetime,
+    start_time_ns: int,
     sender: Optional[str] = None,
     recipients: Optional[list[str]] = None,
 ) -> trace.Span:
@@ -78,10 +196,13 @@ def create_root_span(
 
     The span is started but **not** ended — the caller must call
     ``span.end(end_time=...)`` once all child spans have been ended.
+    Its trace ID is derived from *message_id*, so re-exporting the same
+    message produces the same trace ID.
 
     Args:
         message_id: The RFC 2822 ``Message-ID`` header value.
-        start_time: Absolute start time for the span.
+        start_time_ns: Absolute start time for the span, in nanoseconds
+            since the epoch (see :func:`dt_to_ns`).
         sender: The email sender address (optional).
         recipients: List of email recipient addresses (optional).
 
@@ -89,21 +210,22 @@ def create_root_span(
         A live (not-yet-ended) SDK :class:`~opentelemetry.sdk.trace.Span`.
     """
     tracer = _get_tracer("mailtrace")
-    attributes = {"message.id": message_id}
+    attributes: dict[str, Any] = {"message.id": message_id}
     if sender is not None:
         attributes["email.sender"] = sender
     if recipients is not None:
-        attributes["email.recipients"] = json.dumps(recipients)
-    return tracer.start_span(
-        name="email.delivery",
-        start_time=dt_to_ns(start_time),
-        attributes=attributes,
-    )
+        attributes["email.recipients"] = recipients
+    with _id_generator.use_message_id(message_id):
+        return tracer.start_span(
+            name="email.delivery",
+            start_time=start_time_ns,
+            attributes=attributes,
+        )
 
 
 def create_host_span(
     hostname: str,
-    start_time: datetime,
+    start_time_ns: int,
     parent_context: Any,
     message_id: Optional[str] = None,
     sender: Optional[str] = None,
@@ -122,7 +244,8 @@ def create_host_span(
 
     Args:
         hostname: The mail-server hostname.
-        start_time: Absolute start time for the span.
+        start_time_ns: Absolute start time for the span, in nanoseconds
+            since the epoch (see :func:`dt_to_ns`).
         parent_context: OTEL :class:`~opentelemetry.context.Context` that
             carries the parent span (typically obtained via
             ``trace.set_span_in_context(parent_span)``).
@@ -136,21 +259,22 @@ def create_host_span(
         A live (not-yet-ended) SDK :class:`~opentelemetry.sdk.trace.Span`.
     """
     tracer = _get_tracer(hostname)
-    attributes = {"server.address": hostname}
-    if message_id is not None:
-        attributes["message.id"] = message_id
-    if sender is not None:
-        attributes["email.sender"] = sender
-    if recipients is not None:
-        attributes["email.recipients"] = json.dumps(recipients)
-    if queue_id is not None:
-        attributes["email.queue_id"] = queue_id
-    if next_host is not None:
-        attributes["email.next_host"] = next_host
+    attributes: dict[str, Any] = {"server.address": hostname}
+    attributes.update(
+        (key, value)
+        for key, value in (
+            ("message.id", message_id),
+            ("email.sender", sender),
+            ("email.recipients", recipients),
+            ("email.queue_id", queue_id),
+            ("email.next_host", next_host),
+        )
+        if value is not None
+    )
     return tracer.start_span(
         name=hostname,
         context=parent_context,
-        start_time=dt_to_ns(start_time),
+        start_time=start_time_ns,
         attributes=attributes,
     )
 
@@ -158,50 +282,46 @@ def create_host_span(
 def create_delay_spans(
     delays: DelayInfo,
     hostname: str,
-    start_time: datetime,
+    start_time_ns: int,
     parent_context: Any,
-) -> list[trace.Span]:
+) -> None:
     """Create, start, and end one span per delay stage.
 
     All stage spans share the same *parent_context* (the host span) so they
     appear as siblings under the host in the trace view.  Each span is
-    started with the correct sequential start time derived from *start_time*
-    and the cumulative durations, and immediately ended with the appropriate
-    end time based on the stage duration.
+    started with the correct sequential start time derived from
+    *start_time_ns* and the cumulative durations, and immediately ended with
+    the appropriate end time based on the stage duration.
 
     Args:
         delays: A :class:`~mailtrace.tracing.delay_parser.DelayInfo` object
             containing the delay stages and their durations in seconds.
         hostname: The mail-server hostname; used to look up the correct
             tracer so stage spans share the host's ``service.name``.
-        start_time: Absolute start time of the *first* stage.
+        start_time_ns: Absolute start time of the *first* stage, in
+            nanoseconds since the epoch (see :func:`dt_to_ns`).
         parent_context: OTEL :class:`~opentelemetry.context.Context` that
             carries the parent (host) span.
-
-    Returns:
-        List of completed SDK :class:`~opentelemetry.sdk.trace.Span`
-        objects, one per stage, in the same order as the stages in *delays*.
     """
 
     tracer = _get_tracer(hostname)
-    spans: list[trace.Span] = []
-    current = start_time
-    stage_names = delays.get_delay_values().keys()
-    for name, duration in zip(stage_names, delays.get_delay_values().values()):
+    # Advance in integer nanoseconds between stages.
+    current_ns = start_time_ns
+    for name, duration in delays.get_delay_values().items():
         span = tracer.start_span(
             name=name,
             context=parent_context,
-            start_time=dt_to_ns(current),
+            start_time=current_ns,
             attributes={"delay.duration_seconds": duration},
         )
 
-        # Avoid zero-duration spans which may be ignored by the back-end.
-        duration = max(duration, 2e-6)
-        span.end(end_time=dt_to_ns(current + timedelta(seconds=duration)))
+        end_ns = current_ns + max(round(duration * 1e9), MIN_SPAN_DURATION_NS)
+        span.end(end_time=end_ns)
 
         logger.debug(
-            f"Created span for stage {name} (start={current}, end={current + timedelta(seconds=duration)})"
+            "Created span for stage %s (start=%d, end=%d)",
+            name,
+            current_ns,
+            end_ns,
         )
-        spans.append(span)
-        current = current + timedelta(seconds=duration)
-    return spans
+        current_ns = end_ns
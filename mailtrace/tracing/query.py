@@ -2,162 +2,192 @@
 
 import logging
 import re
+from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import Dict
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator
 
-from opensearchpy import OpenSearch as OSClient
+from opensearchpy.helpers import scan
 from opensearchpy.helpers.search import Search
 
 from mailtrace.config import Config
+from mailtrace.opensearch_client import get_opensearch_client
 from mailtrace.parser import LogEntry, OpensearchParser
+from mailtrace.utils import format_iso_seconds
 
 logger = logging.getLogger("mailtrace")
 
+# Scroll context lifetime and page size used to page through query results
+_SCROLL_KEEPALIVE = "2m"
+_SCROLL_PAGE_SIZE = 2000
 
-def query_all_logs(
+# Message-ID patterns: Postfix logs message-id=<id@domain>, Exim logs
+# id=id@domain (without angle brackets)
+_POSTFIX_MESSAGE_ID_RE = re.compile(r"message-id=<([^>]+)>")
+_EXIM_MESSAGE_ID_RE = re.compile(r"\bid=([\w.\-]+@[\w.\-]+)")
+
+
+@lru_cache(maxsize=16)
+def _parse_tz_offset(tz_offset: str) -> timedelta:
+    """Parse a timezone offset (format: +HH:MM or -HH:MM) into a timedelta.
+
+    The configured offset never changes between polling rounds, so the
+    result is cached.
+    """
+    tz_sign = 1 if tz_offset[0] == "+" else -1
+    tz_parts = tz_offset[1:].split(":")
+    hours_offset = int(tz_parts[0])
+    minutes_offset = int(tz_parts[1]) if len(tz_parts) > 1 else 0
+    return timedelta(
+        hours=tz_sign * hours_offset, minutes=tz_sign * minutes_offset
+    )
+
+
+def iter_all_logs(
     config: Config, start_time: datetime, end_time: datetime
-) -> list[LogEntry]:
-    """Query logs from OpenSearch index with time filtering.
+) -> Iterator[LogEntry]:
+    """Stream logs from OpenSearch index with time filtering.
 
-    Fetches all logs from the configured index matching the time range,
-    chains them directly without additional queries.
+    Fetches all logs from the configured index matching the time range and
+    yields them one by one, in timestamp order, as scroll pages arrive.
+    Errors propagate to the caller, which must discard whatever it has
+    consumed so far rather than treat it as the complete result.
 
     Args:
         config: Configuration object
         start_time: Start time as datetime object
         end_time: End time as datetime object
     """
-    try:
-        # Create OpenSearch client from config
-        client = OSClient(
-            hosts=[
-                {
-                    "host": config.opensearch_config.host,
-                    "port": config.opensearch_config.port,
-                }
-            ],
-            http_auth=(
-                (
-                    config.opensearch_config.username,
-                    config.opensearch_config.password,
-                )
-                if config.opensearch_config.username
-                else None
-            ),
-            use_ssl=config.opensearch_config.use_ssl,
-            verify_certs=config.opensearch_config.verify_certs,
-            timeout=config.opensearch_config.timeout,
-        )
-
-        # Build single query targeting the configured index
-        search = Search(using=client, index=config.opensearch_config.index)
-        search = search.extra(size=10000)
-
-        # Filter by facility (mail) if configured
-        facility_field = config.opensearch_config.mapping.facility
-        if facility_field:
-            search = search.query("match", **{facility_field: "mail"})
-
-        # Convert UTC time to configured timezone offset
-        # e.g., if time is 13:00 UTC and timezone is +03:00, convert to 16:00
-        tz_offset = config.opensearch_config.time_zone
-        # Parse timezone offset (format: +HH:MM or -HH:MM)
-        tz_sign = 1 if tz_offset[0] == "+" else -1
-        tz_parts = tz_offset[1:].split(":")
-        hours_offset = int(tz_parts[0])
-        minutes_offset = int(tz_parts[1]) if len(tz_parts) > 1 else 0
-
-        # Use provided datetime objects directly
-        start_dt = start_time
-        end_dt = end_time
-
-        tz_delta = timedelta(
-            hours=tz_sign * hours_offset, minutes=tz_sign * minutes_offset
-        )
-        start_dt_adjusted = start_dt + tz_delta
-        end_dt_adjusted = end_dt + tz_delta
-
-        start_time_adjusted = start_dt_adjusted.strftime("%Y-%m-%dT%H:%M:%S")
-        end_time_adjusted = end_dt_adjusted.strftime("%Y-%m-%dT%H:%M:%S")
-
-        # Filter by time range only
-        search = search.filter(
-            "range",
-            **{
-                config.opensearch_config.mapping.timestamp: {
-                    "gte": start_time_adjusted,
-                    "lt": end_time_adjusted,
-                    "time_zone": config.opensearch_config.time_zone,
-                }
-            },
-        )
-
-        search = search.sort(
-            {config.opensearch_config.mapping.timestamp: {"order": "asc"}}
-        )
-
-        logger.info(
-            f"Querying {config.opensearch_config.index} index with time range "
-            f"{start_time_adjusted} to {end_time_adjusted} "
-            f"(timezone: {config.opensearch_config.time_zone})"
-        )
-        logger.debug(f"Query: {search.to_dict()}")
-
-        response = search.execute()
-
-        # Parse and chain all logs directly
-        parser = OpensearchParser(mapping=config.opensearch_config.mapping)
-        all_logs = [
-            parser.parse_with_enrichment(hit.to_dict()) for hit in response
-        ]
-
-        logger.info(f"Found {len(all_logs)} log entries from index")
-
+    # Reuse the OpenSearch client (and its pooled connections) across
+    # polling rounds
+    client = get_opensearch_client(config.opensearch_config)
+
+    # Build single query targeting the configured index
+    search = Search(using=client, index=config.opensearch_config.index)
+    # Filter by facility (mail) if configured
+    facility_field = config.opensearch_config.mapping.facility
+    if facility_field:
+        search = search.query("match", **{facility_field: "mail"})
+
+    # Convert UTC time to configured timezone offset
+    # e.g., if time is 13:00 UTC and timezone is +03:00, convert to 16:00
+    tz_delta = _parse_tz_offset(config.opensearch_config.time_zone)
+    start_dt_adjusted = start_time + tz_delta
+    end_dt_adjusted = end_time + tz_delta
+
+    start_time_adjusted = format_iso_seconds(start_dt_adjusted)
+    end_time_adjusted = format_iso_seconds(end_dt_adjusted)
+
+    # Filter by time range only
+    search = search.filter(
+        "range",
+        **{
+            config.opensearch_config.mapping.timestamp: {
+                "gte": start_time_adjusted,
+                "lt": end_time_adjusted,
+                "time_zone": config.opensearch_config.time_zone,
+            }
+        },
+    )
+
+    search = search.sort(
+        {config.opensearch_config.mapping.timestamp: {"order": "asc"}}
+    )
+
+    logger.info(
+        f"Querying {config.opensearch_config.index} index with time range "
+        f"{start_time_adjusted} to {end_time_adjusted} "
+        f"(timezone: {config.opensearch_config.time_zone})"
+    )
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Query: %s", search.to_dict())
+
+    # Page through every hit with the scroll API instead of a single
+    # capped request; preserve_order keeps the timestamp sort that
+    # group_logs_by_message_id relies on.  The scan helper yields raw
+    # hit dicts, so no Hit/AttrDict wrappers are built per document.
+    hits = scan(
+        client,
+        query=search.to_dict(),
+        index=config.opensearch_config.index,
+        scroll=_SCROLL_KEEPALIVE,
+        size=_SCROLL_PAGE_SIZE,
+        preserve_order=True,
+    )
+
+    parser = OpensearchParser(mapping=config.opensearch_config.mapping)
+    debug = logger.isEnabledFor(logging.DEBUG)
+    count = 0
+    for hit in hits:
+        log = parser.parse_with_enrichment(hit["_source"])
         # Debug: Log all entries to see what we're working with
-        for i, log in enumerate(all_logs):
+        if debug:
             logger.debug(
-                f"Log {i}: {log.hostname} | {log.service} | mail_id={log.mail_id} | queued_as={log.queued_as} | {log.message}"
+                "Log %d: %s | %s | mail_id=%s | queued_as=%s | %s",
+                count,
+                log.hostname,
+                log.service,
+                log.mail_id,
+                log.queued_as,
+                log.message,
             )
+        count += 1
+        yield log
 
-        return all_logs
+    logger.info(f"Found {count} log entries from index")
 
-    except Exception as e:
-        logger.error(f"Error querying logs from OpenSearch: {e}")
-        return []
 
-
-def _extract_message_id_from_log(log: LogEntry) -> str | None:
-    """Extract message-id from log entry message content.
+@lru_cache(maxsize=4096)
+def _extract_message_id(message: str) -> str | None:
+    """Extract message-id from log message content.
 
     Postfix logs contain message-id in the format: message-id=<id@domain>
     Exim logs contain message-id in the format: id=id@domain (without angle brackets)
     This is present in logs that include the message-id field.
+
+    Memoised by message text, since the overlapping query window returns
+    the same lines again on the next polling round.
     """
+    # Most lines carry neither field; a substring test rules them out far
+    # more cheaply than running the regexes.
+    if "id=" not in message:
+        return None
+
     # Try Postfix format first: message-id=<id@domain>
-    msg_id_match = re.search(r"message-id=<([^>]+)>", log.message)
-    if msg_id_match:
-        return msg_id_match.group(1)
+    if "message-id=<" in message:
+        msg_id_match = _POSTFIX_MESSAGE_ID_RE.search(message)
+        if msg_id_match:
+            return msg_id_match.group(1)
 
     # Try Exim format: id=id@domain (without angle brackets)
-    exim_id_match = re.search(r"\bid=([\w\d.@-]+@[\w\d.-]+)", log.message)
+    exim_id_match = _EXIM_MESSAGE_ID_RE.search(message)
     if exim_id_match:
         return exim_id_match.group(1)
 
     return None
 
 
+def _extract_message_id_from_log(log: LogEntry) -> str | None:
+    """Extract message-id from log entry message content."""
+    return _extract_message_id(log.message)
+
+
 def group_logs_by_message_id(
-    logs: list[LogEntry],
+    logs: Iterable[LogEntry],
 ) -> Dict[str, list[LogEntry]]:
     """Group log entries by message ID across all hops.
 
     One email maintains the same message-id throughout its delivery across
     multiple hosts, even though the queue_id changes at each hop.
 
+    The logs are consumed in a single pass and must be in timestamp order,
+    so they can be streamed straight from :func:`iter_all_logs`; logs that
+    cannot be tied to a message ID are dropped as they go by.
+
     Returns a dictionary mapping message_id -> list of LogEntry containing all
     logs for that email across all hops.
     """
-    grouped_logs: Dict[str, list[LogEntry]] = {}
+    grouped_logs: defaultdict[str, list[LogEntry]] = defaultdict(list)
     queue_id_to_msg_id_map: dict[tuple[str, str], str] = (
         {}
     )  # (hostname, queue ID) -> message ID
@@ -176,8 +206,6 @@ def group_logs_by_message_id(
             continue
 
         # Add log to grouped_logs under its message ID
-        if message_id not in grouped_logs:
-            grouped_logs[message_id] = []
         grouped_logs[message_id].append(log)
 
         # Register current (hostname, mail_id) mapping for future logs
@@ -190,7 +218,7 @@ def group_logs_by_message_id(
                 message_id
             )
 
-    return grouped_logs
+    return dict(grouped_logs)
 
 
 def group_logs_by_hosts(logs: list[LogEntry]) -> Dict[str, list[LogEntry]]:
@@ -199,9 +227,7 @@ def group_logs_by_hosts(logs: list[LogEntry]) -> Dict[str, list[LogEntry]]:
     Returns a dictionary mapping "hostname" -> list of LogEntry containing all
     logs for that host and service.
     """
-    grouped_logs: Dict[str, list[LogEntry]] = {}
+    grouped_logs: defaultdict[str, list[LogEntry]] = defaultdict(list)
     for log in logs:
-        if log.hostname not in grouped_logs:
-            grouped_logs[log.hostname] = []
         grouped_logs[log.hostname].append(log)
-    return grouped_logs
+    return dict(grouped_logs)
@@ -1,5 +1,5 @@
 import logging
-from time import time
+from time import perf_counter_ns
 
 logger = logging.getLogger("mailtrace")
 
@@ -8,13 +8,14 @@ class TimingMetrics:
     """Tracks timing information for trace generation."""
 
     def __init__(self):
-        self.metrics: dict[str, float] = {}
-        self.start_time: float = 0
+        # Elapsed nanoseconds since start() for each marked step
+        self.metrics: dict[str, int] = {}
+        self.start_time: int = 0
         self.trace_count: int = 0
 
     def start(self) -> None:
         """Start the overall timing."""
-        self.start_time = time()
+        self.start_time = perf_counter_ns()
         self.metrics.clear()
         self.trace_count = 0
 
@@ -23,7 +24,7 @@ class TimingMetrics:
         if self.start_time == 0:
             logger.warning("Timing not started, ignoring mark")
             return
-        elapsed = time() - self.start_time
+        elapsed = perf_counter_ns() - self.start_time
         self.metrics[step_name] = elapsed
 
     def set_trace_count(self, count: int) -> None:
@@ -47,8 +48,8 @@ class TimingMetrics:
 
         current = self.metrics[step_name]
         if previous_step and previous_step in self.metrics:
-            return current - self.metrics[previous_step]
-        return current
+            current -= self.metrics[previous_step]
+        return current / 1e9
 
     def print_summary(self) -> None:
         """Print timing summary with total and per-step durations."""
@@ -1,6 +1,8 @@
 import datetime
+import ipaddress
 import logging
 import re
+import sys
 from dataclasses import dataclass
 
 logger = logging.getLogger("mailtrace")
@@ -8,10 +10,22 @@ logger = logging.getLogger("mailtrace")
 # Regex patterns for time validation
 _TIME_FORMAT_RE = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$")
 _TIME_RANGE_RE = re.compile(r"^(\d+)([dhm])$")
-
-# IP address pattern (IPv4 or IPv6)
-_IP_ADDRESS_RE = re.compile(
-    r"^(?:[0-9]{1,3}\.){3}[0-9]{1,3}$|^(?:[a-fA-F0-9]{1,4}:){7}[a-fA-F0-9]{1,4}$"
+# One unit of each time range suffix accepted by _TIME_RANGE_RE
+_TIME_RANGE_UNITS = {
+    "d": datetime.timedelta(days=1),
+    "h": datetime.timedelta(hours=1),
+    "m": datetime.timedelta(minutes=1),
+}
+
+# datetime.fromisoformat() accepts a trailing "Z" since Python 3.11
+_FROMISOFORMAT_HANDLES_Z = sys.version_info >= (3, 11)
+
+# Regex patterns for extracting relay information from a log message
+# (no leading or trailing ".*", so a search starts from the literal prefix
+# instead of backtracking from every position)
+_QUEUED_RE = re.compile(r"250.*?queued as (?P<id>[0-9A-Z]+)")
+_RELAY_RE = re.compile(
+    r"relay=(?P<host>\S+)\[(?P<ip>[^\]]+)\]:(?P<port>[0-9]+)"
 )
 
 
@@ -44,17 +58,59 @@ def time_range_to_timedelta(time_range: str) -> datetime.timedelta:
     if not match:
         raise ValueError(f"Invalid time range format: {time_range}")
 
-    value = int(match.group(1))
-    unit = match.group(2)
+    value, unit = match.groups()
+    return int(value) * _TIME_RANGE_UNITS[unit]
+
+
+def extract_address(message: str, key: str) -> str | None:
+    """
+    Extract the address from a ``key=<address>`` field in a log message.
+
+    Uses plain substring search instead of a regex since the field is a
+    literal prefix followed by everything up to the closing bracket.
+
+    Args:
+        message: The log message to search.
+        key: The field name, e.g. "from" or "to".
+
+    Returns:
+        The (possibly empty) address between the brackets, or None if the
+        field is not present.
+    """
+    prefix = f"{key}=<"
+    start = message.find(prefix)
+    if start < 0:
+        return None
+    start += len(prefix)
+    end = message.find(">", start)
+    if end < 0:
+        return None
+    return message[start:end]
+
+
+def parse_iso_datetime(value: str) -> datetime.datetime:
+    """
+    Parse an ISO 8601 timestamp, accepting a trailing "Z" for UTC.
+
+    On Python 3.11+ the string is handed to datetime.fromisoformat() as-is;
+    older versions get the "Z" rewritten to "+00:00" first.
+    """
+    if _FROMISOFORMAT_HANDLES_Z or not value.endswith("Z"):
+        return datetime.datetime.fromisoformat(value)
+    return datetime.datetime.fromisoformat(value[:-1] + "+00:00")
+
 
-    if unit == "d":
-        return datetime.timedelta(days=value)
-    if unit == "h":
-        return datetime.timedelta(hours=value)
-    if unit == "m":
-        return datetime.timedelta(minutes=value)
+def format_iso_seconds(dt: datetime.datetime) -> str:
+    """
+    Format a datetime as "YYYY-MM-DDTHH:MM:SS", dropping any timezone.
 
-    raise ValueError(f"Invalid time range unit: {unit}")
+    Equivalent to dt.strftime("%Y-%m-%dT%H:%M:%S"), but built with an
+    f-string to skip strftime's format parsing.
+    """
+    return (
+        f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d}"
+        f"T{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}"
+    )
 
 
 def print_blue(text: str) -> None:
@@ -67,6 +123,15 @@ def print_red(text: str) -> None:
     print(f"\033[91m{text}\033[0m")
 
 
+def _is_ip_address(value: str) -> bool:
+    """Check whether *value* is a literal IPv4 or IPv6 address."""
+    try:
+        ipaddress.ip_address(value)
+    except ValueError:
+        return False
+    return True
+
+
 def get_hosts(hostnames: list[str], domain: str) -> list[str]:
     """
     Generate a list of possible hostnames based on the given hostnames and domain.
@@ -86,7 +151,7 @@ def get_hosts(hostnames: list[str], domain: str) -> list[str]:
     logger.debug(
         f"Generating hosts for hostnames: {hostnames} and domain: {domain}"
     )
-    hosts: list[str] = []
+    hosts: set[str] = set()
 
     for hostname in hostnames:
         hostname = hostname.strip()
@@ -94,20 +159,20 @@ def get_hosts(hostnames: list[str], domain: str) -> list[str]:
             continue
 
         # IP addresses are kept as-is
-        if _IP_ADDRESS_RE.match(hostname):
-            hosts.append(hostname)
+        if _is_ip_address(hostname):
+            hosts.add(hostname)
             continue
 
         # Add both short and FQDN forms
         if "." in hostname:
-            hosts.append(hostname)
-            hosts.append(hostname.split(".")[0])
+            hosts.add(hostname)
+            hosts.add(hostname.split(".")[0])
         else:
-            hosts.append(hostname)
+            hosts.add(hostname)
             if domain:
-                hosts.append(f"{hostname}.{domain}")
+                hosts.add(f"{hostname}.{domain}")
 
-    result = list(set(hosts))
+    result = list(hosts)
     logger.debug(f"Generated hosts: {result}")
     return result
 
@@ -143,23 +208,12 @@ def analyze_log_from_message(message: str) -> RelayResult | None:
         >>> if result:
         ...     print(f"Mail ID: {result.mail_id}, Relay: {result.relay_host}[{result.relay_ip}]:{result.relay_port}")
     """
-    _SUCCESS_RE = re.compile(r".*([0-9]{3})\s.*")
-    _QUEUED_RE = re.compile(r"250.*queued as (?P<id>[0-9A-Z]+).*")
-    _RELAY_RE = re.compile(
-        r".*relay=(?P<host>[^\s]+)\[(?P<ip>[^\]]+)\]:(?P<port>[0-9]+).*"
-    )
-
-    success_match = _SUCCESS_RE.match(message)
-    if not success_match:
-        return None
-    smtp_code = int(success_match.group(1))
-    if smtp_code != 250:
+    # Only accepted relays carry a next-hop queue ID; these substring tests
+    # rule out almost every other line before any regex runs.
+    if "250 " not in message or "queued as " not in message:
         return None
-
-    queued_match = _QUEUED_RE.search(message)
-    if not queued_match:
-        return None
-    next_mail_id = queued_match.group("id")
+    # The queued-as pattern itself requires the 250 reply
+    smtp_code = 250
 
     relay_match = _RELAY_RE.search(message)
     if not relay_match:
@@ -168,6 +222,16 @@ def analyze_log_from_message(message: str) -> RelayResult | None:
     relay_ip = relay_match.group("ip")
     relay_port = int(relay_match.group("port"))
 
+    # Postfix logs the reply after the relay, so look for the queue ID in
+    # the tail first and only then before the relay; either way no byte
+    # of the message is scanned twice.
+    queued_match = _QUEUED_RE.search(
+        message, relay_match.end()
+    ) or _QUEUED_RE.search(message, 0, relay_match.start())
+    if not queued_match:
+        return None
+    next_mail_id = queued_match.group("id")
+
     return RelayResult(
         mail_id=next_mail_id,
         smtp_code=smtp_code,